@@ -1,13 +1,35 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+import os
+
+# Size the OpenMP/MKL/OpenBLAS thread pools so WEB_CONCURRENCY workers x
+# threads roughly matches the available cores, instead of every worker
+# grabbing all of them. This has to run before numpy/paddle are imported,
+# since they read these variables at import time.
+_cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+for _var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+    os.environ.setdefault(_var, str(max(1, _cores // int(os.getenv('WEB_CONCURRENCY', '1')))))
+CPU_THREADS = int(os.environ['OMP_NUM_THREADS'])
+
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse
 from paddleocr import PaddleOCR
+from cachetools import LRUCache
+from redis.exceptions import RedisError
+import cv2
 import numpy as np
-from PIL import Image
+import orjson
+import redis.asyncio
+from PIL import Image, UnidentifiedImageError
+from concurrent.futures import ThreadPoolExecutor
+from importlib import metadata
+from typing import BinaryIO, Optional, Tuple
+import asyncio
+import hashlib
 import io
 import time
 
-app = FastAPI(title="PaddleOCR Service", version="1.0.0")
+app = FastAPI(title="PaddleOCR Service", version="1.0.0", default_response_class=ORJSONResponse)
 
 # Add CORS middleware
 app.add_middleware(
@@ -18,70 +40,338 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Execution backend: 'paddle' (default) or 'trt' (Paddle Inference's
+# TensorRT subgraph engine in FP16; requires USE_GPU=1 and a TRT-enabled
+# paddlepaddle-gpu build)
+USE_GPU = os.getenv("USE_GPU", "0") == "1"
+PADDLE_BACKEND = os.getenv("PADDLE_BACKEND", "paddle").lower()
+USE_TENSORRT = USE_GPU and PADDLE_BACKEND == "trt"
+
+# Skip loading the text-angle classifier when every input is known to be
+# upright (e.g. pages rendered from PDFs); requests can then never use it
+ANGLE_CLS = os.getenv("OCR_ASSUME_UPRIGHT", "0") != "1"
+
 # Initialize PaddleOCR (loads once on startup)
 # use_angle_cls: Detect rotated text
 # lang: Language model (en, ch, etc.)
-# use_gpu: Set to True if GPU available
+# use_gpu: Set USE_GPU=1 if GPU available
 ocr = PaddleOCR(
-    use_angle_cls=True,
+    use_angle_cls=ANGLE_CLS,
     lang='en',
-    use_gpu=False,  # Set to True if GPU available
+    use_gpu=USE_GPU,
+    use_tensorrt=USE_TENSORRT,
+    precision='fp16' if USE_TENSORRT else 'fp32',
+    # CPU backend: oneDNN kernels with a bounded intra-op thread count
+    enable_mkldnn=not USE_GPU,
+    cpu_threads=CPU_THREADS,
     show_log=False
 )
 
+# Run inference on a single dedicated thread so the event loop stays
+# responsive while OCR is in progress; bursts of uploads queue up behind it.
+# The engine is one shared instance whose predictors reuse their input and
+# output tensors, so it must never run on two threads at once. Scale out
+# with WEB_CONCURRENCY (one engine per worker process) instead.
+EXECUTOR = ThreadPoolExecutor(max_workers=1)
+
+# Max requests per worker holding a decoded image (waiting for or running
+# inference); later ones wait before decoding, so a burst of uploads can't
+# pile up decoded pages in memory behind the single inference thread
+OCR_MAX_PENDING = int(os.getenv("OCR_MAX_PENDING", "2"))
+SEM = asyncio.Semaphore(max(1, OCR_MAX_PENDING))
+
+# Run a synthetic inference at startup (set OCR_WARMUP=0 to skip)
+OCR_WARMUP = os.getenv("OCR_WARMUP", "1") == "1"
+
+# Reject images above this many pixels before decoding (413); also replaces
+# PIL's decompression-bomb check, which would otherwise surface as a 500
+MAX_PIXELS = int(os.getenv("OCR_MAX_PIXELS", "50000000"))
+Image.MAX_IMAGE_PIXELS = None
+
+# Downscale uploads whose long edge exceeds this before OCR (0 disables).
+# The engines resize internally anyway; shrinking first avoids converting
+# and copying full-resolution scans.
+MAX_EDGE = int(os.getenv("OCR_MAX_EDGE", "1600"))
+
+# Keep OpenCV's own thread pool from competing with inference threads
+cv2.setNumThreads(1)
+
+# Cache OCR results by image content hash so retried or re-queued pages skip
+# inference. Uses Redis (shared across workers) when REDIS_URL is set,
+# otherwise a per-process LRU. Keys include the engine version, backend,
+# precision and decode settings, so changing any of them invalidates old
+# entries.
+OCR_CACHE = os.getenv("OCR_CACHE", "1") == "1"
+OCR_CACHE_SIZE = int(os.getenv("OCR_CACHE_SIZE", "4096"))
+OCR_CACHE_TTL = int(os.getenv("OCR_CACHE_TTL", "86400"))
+REDIS_URL = os.getenv("REDIS_URL")
+# After a Redis error, skip it for this many seconds instead of paying the
+# connect/read timeout on every request while it is down
+REDIS_BACKOFF = float(os.getenv("REDIS_BACKOFF", "30"))
+
+
+class ResultCache:
+    """OCR responses keyed by a BLAKE2b hash of the uploaded bytes."""
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        self.local = LRUCache(maxsize=max(1, OCR_CACHE_SIZE))
+        self.redis = (
+            redis.asyncio.from_url(REDIS_URL, socket_connect_timeout=1, socket_timeout=1)
+            if REDIS_URL else None
+        )
+        self.redis_retry_at = 0.0
+
+    def redis_available(self) -> bool:
+        return self.redis is not None and time.monotonic() >= self.redis_retry_at
+
+    def redis_failed(self, action: str, error: RedisError):
+        print(f"Warning: Redis cache {action} failed, bypassing it for {REDIS_BACKOFF:.0f}s: {error}")
+        self.redis_retry_at = time.monotonic() + REDIS_BACKOFF
+
+    def key(self, upload: BinaryIO) -> str:
+        digest = hashlib.blake2b(digest_size=16)
+        for chunk in iter(lambda: upload.read(1 << 20), b""):
+            digest.update(chunk)
+        upload.seek(0)
+        return f"{self.namespace}:{digest.hexdigest()}"
+
+    async def get(self, key: str) -> Optional[dict]:
+        payload = None
+        if self.redis_available():
+            try:
+                payload = await self.redis.get(key)
+            except RedisError as e:
+                self.redis_failed("read", e)
+        if payload is None:
+            payload = self.local.get(key)
+        return orjson.loads(payload) if payload is not None else None
+
+    async def set(self, key: str, result: dict):
+        payload = orjson.dumps(result, option=orjson.OPT_SERIALIZE_NUMPY)
+        if self.redis_available():
+            try:
+                await self.redis.set(key, payload, ex=OCR_CACHE_TTL)
+                return
+            except RedisError as e:
+                self.redis_failed("write", e)
+        self.local[key] = payload
+
+result_cache = ResultCache(
+    f"ocr:v2:paddleocr:{metadata.version('paddleocr')}:{'trt' if USE_TENSORRT else 'paddle'}:{MAX_EDGE}"
+)
+
+
+def check_pixel_limit(width: int, height: int):
+    if width * height > MAX_PIXELS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Image too large: {width}x{height} exceeds {MAX_PIXELS} pixels"
+        )
+
+def reduced_imread_flag(width: int, height: int) -> int:
+    """Pick the largest JPEG DCT-domain reduction (1/2, 1/4, 1/8) that keeps the long edge >= MAX_EDGE."""
+    long_edge = max(width, height)
+    for factor, flag in (
+        (8, cv2.IMREAD_REDUCED_COLOR_8),
+        (4, cv2.IMREAD_REDUCED_COLOR_4),
+        (2, cv2.IMREAD_REDUCED_COLOR_2),
+    ):
+        if long_edge // factor >= MAX_EDGE:
+            return flag
+    return cv2.IMREAD_COLOR
+
+def fit_to_max_edge(img_array: np.ndarray) -> np.ndarray:
+    """Downscale so the long edge is at most MAX_EDGE."""
+    height, width = img_array.shape[:2]
+    scale = MAX_EDGE / max(height, width)
+    if scale >= 1.0:
+        return img_array
+    return cv2.resize(
+        img_array,
+        (int(width * scale), int(height * scale)),
+        interpolation=cv2.INTER_AREA
+    )
+
+def decode_image(upload: BinaryIO) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """
+    Decode an uploaded image file into an RGB uint8 array, downscaled to MAX_EDGE.
+    Also returns the original (width, height) so boxes can be mapped back.
+    """
+    # Opening with PIL only parses the header, so oversized images are
+    # rejected before any pixel buffer is allocated
+    try:
+        image = Image.open(upload)
+        check_pixel_limit(*image.size)
+    except UnidentifiedImageError:
+        image = None
+
+    # OpenCV decodes JPEG/PNG straight into a contiguous array in one C call.
+    # Large JPEGs are shrunk during decode via libjpeg's DCT scaling, which is
+    # essentially free compared to decoding at full size and resizing
+    flag = cv2.IMREAD_COLOR
+    if MAX_EDGE and image is not None and image.format == 'JPEG':
+        flag = reduced_imread_flag(*image.size)
+    upload.seek(0)
+    # Leave EXIF orientation alone, as PIL did before: pixels (and boxes)
+    # stay in the stored frame and match the header size read above
+    img_array = cv2.imdecode(
+        np.frombuffer(upload.read(), np.uint8), flag | cv2.IMREAD_IGNORE_ORIENTATION
+    )
+    if img_array is not None:
+        if image is None:
+            check_pixel_limit(img_array.shape[1], img_array.shape[0])
+        original_size = image.size if image is not None else (img_array.shape[1], img_array.shape[0])
+        if MAX_EDGE:
+            img_array = fit_to_max_edge(img_array)
+        return cv2.cvtColor(img_array, cv2.COLOR_BGR2RGB), original_size
+
+    if image is None:
+        raise ValueError("Unsupported image format")
+
+    # Fall back to PIL for formats OpenCV can't read (e.g., GIF)
+    original_size = image.size
+    if image.format == 'JPEG':
+        # Have libjpeg-turbo emit RGB (and downscale, if oversized) while decoding
+        image.draft('RGB', (MAX_EDGE, MAX_EDGE) if MAX_EDGE else image.size)
+
+    # Convert to RGB if necessary
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    scale = MAX_EDGE / max(image.size) if MAX_EDGE else 1.0
+    if scale < 1.0:
+        image = image.resize(
+            (int(image.width * scale), int(image.height * scale)), Image.LANCZOS
+        )
+
+    # View the decoded pixels instead of copying them
+    return np.asarray(image), original_size
+
+def warmup_image() -> np.ndarray:
+    """A white page with a few printed lines, so warmup reaches recognition (and the angle classifier), not just detection"""
+    page = np.full((640, 640, 3), 255, dtype=np.uint8)
+    for row, line in enumerate(('The quick brown fox', 'jumps over the lazy dog', 'x = (a + b) / 2')):
+        cv2.putText(
+            page, line, (32, 160 + row * 100), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 0), 2, cv2.LINE_AA
+        )
+    return page
+
+@app.on_event("startup")
+async def check_exif_orientation():
+    """
+    Decode a JPEG tagged EXIF orientation 6 (rotate 90 degrees) and make sure
+    the decoded frame matches the original size decode_image reports;
+    otherwise every box on a rotated phone photo would be rescaled wrongly
+    """
+    buf = io.BytesIO()
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    Image.new('RGB', (64, 32), 'white').save(buf, 'JPEG', exif=exif.tobytes())
+    buf.seek(0)
+    img_array, (orig_width, orig_height) = decode_image(buf)
+    height, width = img_array.shape[:2]
+    if (width > height) != (orig_width > orig_height):
+        raise RuntimeError(
+            f"decode_image applied EXIF rotation: decoded {width}x{height}, "
+            f"reported original {orig_width}x{orig_height}"
+        )
+
+@app.on_event("startup")
+async def warmup():
+    """Run a synthetic inference so predictor init happens before the first request"""
+    if not OCR_WARMUP:
+        return
+
+    start_time = time.time()
+    try:
+        page = warmup_image()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(EXECUTOR, lambda: ocr.ocr(page, cls=ANGLE_CLS))
+        print(f"PaddleOCR warmup finished in {(time.time() - start_time) * 1000:.0f} ms")
+    except Exception as e:
+        print(f"Warning: PaddleOCR warmup failed: {e}")
+
 @app.post("/ocr")
-async def perform_ocr(file: UploadFile = File(...)):
+async def perform_ocr(file: UploadFile = File(...), upright: bool = Form(True)):
     """
     Perform OCR on uploaded image
+    Set upright=false for photos that may be rotated, to run the angle classifier
     Returns: {engine, text, confidence, processingTime, lines}
     """
     start_time = time.time()
+    # The classifier runs once per detected box, so skip it for upright pages
+    use_cls = ANGLE_CLS and not upright
 
     try:
-        # Read image
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
-
-        # Convert to RGB if necessary
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
+        # Identical uploads (retries, re-queued pages) are served from cache;
+        # hashing reads the whole upload, so it runs in the threadpool too
+        cache_key = (
+            f"{await run_in_threadpool(result_cache.key, file.file)}:cls{int(use_cls)}"
+            if OCR_CACHE else None
+        )
+        cached = await result_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            cached["cached"] = True
+            cached["processingTime"] = (time.time() - start_time) * 1000
+            return ORJSONResponse(cached)
 
-        img_array = np.array(image)
+        async with SEM:
+            # Uploads over 1 MB are spooled to disk, and decoding a large page
+            # takes a while, so read and decode off the event loop
+            img_array, (orig_width, orig_height) = await run_in_threadpool(decode_image, file.file)
 
-        # Perform OCR
-        result = ocr.ocr(img_array, cls=True)
+            # Perform OCR off the event loop
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                EXECUTOR, lambda: ocr.ocr(img_array, cls=use_cls)
+            )
 
         # Parse results
-        texts = []
-        confidences = []
+        lines = result[0] if result else None
+        text_buf = io.StringIO()
         bboxes = []
+        conf_sum = 0.0
+
+        if lines:
+            # Flatten every 4-point box to 8 floats in one NumPy pass; rows
+            # are serialized directly by orjson
+            flat_bboxes = np.asarray(
+                [bbox for bbox, _ in lines], dtype=np.float64
+            ).reshape(len(lines), -1)
+            # Report boxes in the uploaded image's coordinates, not the
+            # downscaled copy OCR ran on
+            height, width = img_array.shape[:2]
+            if (width, height) != (orig_width, orig_height):
+                flat_bboxes *= np.tile([orig_width / width, orig_height / height], 4)
 
-        if result and result[0]:
-            for line in result[0]:
-                bbox, (text, confidence) = line
-                texts.append(text)
-                confidences.append(float(confidence))
-                # Convert bbox to simple format
-                bboxes.append({
-                    'bbox': [float(coord) for point in bbox for coord in point],
-                    'text': text,
-                    'confidence': float(confidence)
-                })
-
-        # Combine all text
-        full_text = " ".join(texts) if texts else ""
-        avg_confidence = sum(confidences) / len(confidences) if confidences else 0.0
+            # Single pass: combined text, running confidence sum, line records
+            for i, (bbox, (_, (text, confidence))) in enumerate(zip(flat_bboxes, lines)):
+                if i:
+                    text_buf.write(" ")
+                text_buf.write(text)
+                conf_sum += confidence
+                bboxes.append({'bbox': bbox, 'text': text, 'confidence': confidence})
+
+        full_text = text_buf.getvalue()
+        avg_confidence = conf_sum / len(bboxes) if bboxes else 0.0
 
         processing_time = (time.time() - start_time) * 1000  # ms
 
-        return JSONResponse({
+        response = {
             "engine": "paddleocr",
             "text": full_text,
             "confidence": avg_confidence,
             "processingTime": processing_time,
             "lines": bboxes
-        })
+        }
+        if cache_key:
+            await result_cache.set(cache_key, response)
+
+        return ORJSONResponse(response)
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"OCR processing failed: {str(e)}")
 
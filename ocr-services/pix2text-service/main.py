@@ -1,12 +1,48 @@
+import os
+
+# Size the OpenMP/MKL/OpenBLAS thread pools so WEB_CONCURRENCY workers x
+# threads roughly matches the available cores, instead of every worker
+# grabbing all of them. This has to run before numpy/torch are imported,
+# since they read these variables at import time.
+_cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+for _var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+    os.environ.setdefault(_var, str(max(1, _cores // int(os.getenv("WEB_CONCURRENCY", "1")))))
+CPU_THREADS = int(os.environ["OMP_NUM_THREADS"])
+
+# Unless USE_GPU=1, hide CUDA devices before torch loads. The engine would
+# otherwise pick a visible GPU by itself, and since CPU deployments preload
+# the app in the gunicorn master (gunicorn.conf.py), CUDA would be
+# initialized there and then forked into the workers.
+if os.getenv("USE_GPU", "0") != "1":
+    os.environ["CUDA_VISIBLE_DEVICES"] = ""
+
 from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import ORJSONResponse
 from pix2text import Pix2Text
-from PIL import Image
+from PIL import Image, UnidentifiedImageError
+from cachetools import LRUCache
+from redis.exceptions import RedisError
+import cv2
+import numpy as np
+import orjson
+import redis.asyncio
+import torch
+from concurrent.futures import ThreadPoolExecutor
+from importlib import metadata
+from typing import BinaryIO, Optional
+import asyncio
+import hashlib
 import io
 import time
 
-app = FastAPI(title="Pix2Text Service", version="1.0.0")
+# Match torch's intra-op pool to CPU_THREADS; inter-op parallelism only adds
+# contention when requests are already serialized through the executor
+torch.set_num_threads(CPU_THREADS)
+torch.set_num_interop_threads(1)
+
+app = FastAPI(title="Pix2Text Service", version="1.0.0", default_response_class=ORJSONResponse)
 
 # Add CORS middleware
 app.add_middleware(
@@ -17,14 +53,268 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Inference backend: 'torch' (default) or 'onnx'. The ONNX path runs the
+# formula detector, LaTeX recognizer and text OCR models on ONNX Runtime;
+# with USE_GPU=1 and onnxruntime-gpu installed, the LaTeX recognizer (the
+# transformer that dominates latency) uses the TensorRT execution provider
+# in FP16, falling back to CUDA and then CPU
+USE_GPU = os.getenv("USE_GPU", "0") == "1"
+PIX2TEXT_BACKEND = os.getenv("PIX2TEXT_BACKEND", "torch").lower()
+# ONNX Runtime names cached engines after the model hash and GPU compute
+# capability, so one cache directory can serve different GPUs
+TRT_CACHE = os.getenv("PIX2TEXT_TRT_CACHE", "/models/trt")
+
+def ort_provider():
+    """Pick the fastest available ONNX Runtime execution provider and its options"""
+    import onnxruntime as ort
+
+    available = ort.get_available_providers()
+    if USE_GPU and 'TensorrtExecutionProvider' in available:
+        os.makedirs(TRT_CACHE, exist_ok=True)
+        return 'TensorrtExecutionProvider', {
+            'trt_fp16_enable': True,
+            'trt_engine_cache_enable': True,
+            'trt_engine_cache_path': TRT_CACHE,
+        }
+    if USE_GPU and 'CUDAExecutionProvider' in available:
+        return 'CUDAExecutionProvider', {}
+    return 'CPUExecutionProvider', {}
+
+def pix2text_configs() -> Optional[dict]:
+    """Per-model Pix2Text configs selecting the ONNX backends (None keeps the defaults)"""
+    if PIX2TEXT_BACKEND != 'onnx':
+        return None
+
+    provider, provider_options = ort_provider()
+    print(f"Pix2Text ONNX backend using {provider}")
+    return {
+        'text_formula': {
+            'mfd': {'model_backend': 'onnx'},
+            'formula': {
+                'model_backend': 'onnx',
+                'more_model_configs': {
+                    'provider': provider,
+                    'provider_options': provider_options,
+                },
+            },
+            'text': {'det_model_backend': 'onnx', 'rec_model_backend': 'onnx'},
+        },
+    }
+
 # Initialize Pix2Text (loads once on startup)
 # This engine is specialized for mathematical formulas
 try:
-    p2t = Pix2Text.from_config()
+    p2t = Pix2Text.from_config(total_configs=pix2text_configs())
 except Exception as e:
-    print(f"Warning: Could not initialize Pix2Text with default config: {e}")
+    print(f"Warning: Could not initialize Pix2Text with {PIX2TEXT_BACKEND} config: {e}")
     p2t = Pix2Text()
 
+# Run inference on a single dedicated thread so the event loop stays
+# responsive while OCR is in progress; bursts of uploads queue up behind it.
+# p2t is a single shared Pix2Text instance, which isn't thread-safe, so it
+# must never run on two threads at once. Scale out with WEB_CONCURRENCY
+# (one engine per worker process) instead.
+EXECUTOR = ThreadPoolExecutor(max_workers=1)
+
+# Max requests per worker holding a decoded image (waiting for or running
+# inference); later ones wait before decoding, so a burst of uploads can't
+# pile up decoded pages in memory behind the single inference thread
+OCR_MAX_PENDING = int(os.getenv("OCR_MAX_PENDING", "2"))
+SEM = asyncio.Semaphore(max(1, OCR_MAX_PENDING))
+
+# Run a synthetic inference at startup (set OCR_WARMUP=0 to skip)
+OCR_WARMUP = os.getenv("OCR_WARMUP", "1") == "1"
+
+# Reject images above this many pixels before decoding (413); also replaces
+# PIL's decompression-bomb check, which would otherwise surface as a 500
+MAX_PIXELS = int(os.getenv("OCR_MAX_PIXELS", "50000000"))
+Image.MAX_IMAGE_PIXELS = None
+
+# Downscale uploads whose long edge exceeds this before OCR (0 disables).
+# The engines resize internally anyway; shrinking first avoids converting
+# and copying full-resolution scans.
+MAX_EDGE = int(os.getenv("OCR_MAX_EDGE", "1600"))
+
+# Keep OpenCV's own thread pool from competing with inference threads
+cv2.setNumThreads(1)
+
+# Cache OCR results by image content hash so retried or re-queued pages skip
+# inference. Uses Redis (shared across workers) when REDIS_URL is set,
+# otherwise a per-process LRU. Keys include the engine version, backend,
+# precision and decode settings, so changing any of them invalidates old
+# entries.
+OCR_CACHE = os.getenv("OCR_CACHE", "1") == "1"
+OCR_CACHE_SIZE = int(os.getenv("OCR_CACHE_SIZE", "4096"))
+OCR_CACHE_TTL = int(os.getenv("OCR_CACHE_TTL", "86400"))
+REDIS_URL = os.getenv("REDIS_URL")
+# After a Redis error, skip it for this many seconds instead of paying the
+# connect/read timeout on every request while it is down
+REDIS_BACKOFF = float(os.getenv("REDIS_BACKOFF", "30"))
+
+
+class ResultCache:
+    """OCR responses keyed by a BLAKE2b hash of the uploaded bytes."""
+
+    def __init__(self, namespace: str):
+        self.namespace = namespace
+        self.local = LRUCache(maxsize=max(1, OCR_CACHE_SIZE))
+        self.redis = (
+            redis.asyncio.from_url(REDIS_URL, socket_connect_timeout=1, socket_timeout=1)
+            if REDIS_URL else None
+        )
+        self.redis_retry_at = 0.0
+
+    def redis_available(self) -> bool:
+        return self.redis is not None and time.monotonic() >= self.redis_retry_at
+
+    def redis_failed(self, action: str, error: RedisError):
+        print(f"Warning: Redis cache {action} failed, bypassing it for {REDIS_BACKOFF:.0f}s: {error}")
+        self.redis_retry_at = time.monotonic() + REDIS_BACKOFF
+
+    def key(self, upload: BinaryIO) -> str:
+        digest = hashlib.blake2b(digest_size=16)
+        for chunk in iter(lambda: upload.read(1 << 20), b""):
+            digest.update(chunk)
+        upload.seek(0)
+        return f"{self.namespace}:{digest.hexdigest()}"
+
+    async def get(self, key: str) -> Optional[dict]:
+        payload = None
+        if self.redis_available():
+            try:
+                payload = await self.redis.get(key)
+            except RedisError as e:
+                self.redis_failed("read", e)
+        if payload is None:
+            payload = self.local.get(key)
+        return orjson.loads(payload) if payload is not None else None
+
+    async def set(self, key: str, result: dict):
+        payload = orjson.dumps(result, option=orjson.OPT_SERIALIZE_NUMPY)
+        if self.redis_available():
+            try:
+                await self.redis.set(key, payload, ex=OCR_CACHE_TTL)
+                return
+            except RedisError as e:
+                self.redis_failed("write", e)
+        self.local[key] = payload
+
+# ONNX on GPU may run the recognizer in TensorRT FP16, so it gets its own entries
+result_cache = ResultCache(
+    f"ocr:v2:pix2text:{metadata.version('pix2text')}:{PIX2TEXT_BACKEND}:{'gpu' if USE_GPU else 'cpu'}:{MAX_EDGE}"
+)
+
+
+def check_pixel_limit(width: int, height: int):
+    if width * height > MAX_PIXELS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Image too large: {width}x{height} exceeds {MAX_PIXELS} pixels"
+        )
+
+def reduced_imread_flag(width: int, height: int) -> int:
+    """Pick the largest JPEG DCT-domain reduction (1/2, 1/4, 1/8) that keeps the long edge >= MAX_EDGE."""
+    long_edge = max(width, height)
+    for factor, flag in (
+        (8, cv2.IMREAD_REDUCED_COLOR_8),
+        (4, cv2.IMREAD_REDUCED_COLOR_4),
+        (2, cv2.IMREAD_REDUCED_COLOR_2),
+    ):
+        if long_edge // factor >= MAX_EDGE:
+            return flag
+    return cv2.IMREAD_COLOR
+
+def fit_to_max_edge(img_array: np.ndarray) -> np.ndarray:
+    """Downscale so the long edge is at most MAX_EDGE."""
+    height, width = img_array.shape[:2]
+    scale = MAX_EDGE / max(height, width)
+    if scale >= 1.0:
+        return img_array
+    return cv2.resize(
+        img_array,
+        (int(width * scale), int(height * scale)),
+        interpolation=cv2.INTER_AREA
+    )
+
+def decode_image(upload: BinaryIO) -> Image.Image:
+    """Decode an uploaded image file into an RGB PIL image, downscaled to MAX_EDGE."""
+    # Opening with PIL only parses the header, so oversized images are
+    # rejected before any pixel buffer is allocated
+    try:
+        image = Image.open(upload)
+        check_pixel_limit(*image.size)
+    except UnidentifiedImageError:
+        image = None
+
+    # OpenCV decodes JPEG/PNG straight into a contiguous array in one C call.
+    # Large JPEGs are shrunk during decode via libjpeg's DCT scaling, which is
+    # essentially free compared to decoding at full size and resizing. The
+    # array is then wrapped in PIL rather than decoded a second time
+    flag = cv2.IMREAD_COLOR
+    if MAX_EDGE and image is not None and image.format == 'JPEG':
+        flag = reduced_imread_flag(*image.size)
+    upload.seek(0)
+    # Leave EXIF orientation alone, as PIL did before: pixels (and boxes)
+    # stay in the stored frame and match the header size read above
+    img_array = cv2.imdecode(
+        np.frombuffer(upload.read(), np.uint8), flag | cv2.IMREAD_IGNORE_ORIENTATION
+    )
+    if img_array is not None:
+        if image is None:
+            check_pixel_limit(img_array.shape[1], img_array.shape[0])
+        if MAX_EDGE:
+            img_array = fit_to_max_edge(img_array)
+        return Image.fromarray(cv2.cvtColor(img_array, cv2.COLOR_BGR2RGB))
+
+    if image is None:
+        raise ValueError("Unsupported image format")
+
+    # Fall back to PIL for formats OpenCV can't read (e.g., GIF)
+    if image.format == 'JPEG':
+        # Have libjpeg-turbo emit RGB (and downscale, if oversized) while decoding
+        image.draft('RGB', (MAX_EDGE, MAX_EDGE) if MAX_EDGE else image.size)
+
+    # Convert to RGB if necessary
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    scale = MAX_EDGE / max(image.size) if MAX_EDGE else 1.0
+    if scale < 1.0:
+        image = image.resize(
+            (int(image.width * scale), int(image.height * scale)), Image.LANCZOS
+        )
+
+    return image
+
+def warmup_image() -> np.ndarray:
+    """A white page with a few printed lines, so warmup reaches the text and formula recognizers, not just detection"""
+    page = np.full((640, 640, 3), 255, dtype=np.uint8)
+    for row, line in enumerate(('The quick brown fox', 'jumps over the lazy dog', 'x = (a + b) / 2')):
+        cv2.putText(
+            page, line, (32, 160 + row * 100), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 0), 2, cv2.LINE_AA
+        )
+    return page
+
+@app.on_event("startup")
+async def warmup():
+    """Run a synthetic inference so CUDA init and kernel autotuning happen before the first request"""
+    if not OCR_WARMUP:
+        return
+
+    if torch.cuda.is_available():
+        torch.backends.cudnn.benchmark = True
+
+    start_time = time.time()
+    try:
+        page = Image.fromarray(warmup_image())
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            EXECUTOR, lambda: p2t.recognize(page, return_text=True)
+        )
+        print(f"Pix2Text warmup finished in {(time.time() - start_time) * 1000:.0f} ms")
+    except Exception as e:
+        print(f"Warning: Pix2Text warmup failed: {e}")
+
 @app.post("/ocr")
 async def perform_ocr(file: UploadFile = File(...)):
     """
@@ -34,16 +324,25 @@ async def perform_ocr(file: UploadFile = File(...)):
     start_time = time.time()
 
     try:
-        # Read image
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
+        # Identical uploads (retries, re-queued pages) are served from cache;
+        # hashing reads the whole upload, so it runs in the threadpool too
+        cache_key = await run_in_threadpool(result_cache.key, file.file) if OCR_CACHE else None
+        cached = await result_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            cached["cached"] = True
+            cached["processingTime"] = (time.time() - start_time) * 1000
+            return ORJSONResponse(cached)
 
-        # Convert to RGB if necessary
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
+        async with SEM:
+            # Uploads over 1 MB are spooled to disk, and decoding a large page
+            # takes a while, so read and decode off the event loop
+            image = await run_in_threadpool(decode_image, file.file)
 
-        # Perform OCR with Pix2Text
-        result = p2t.recognize(image, return_text=True)
+            # Perform OCR with Pix2Text off the event loop
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(
+                EXECUTOR, lambda: p2t.recognize(image, return_text=True)
+            )
 
         # Parse results
         # Pix2Text returns a list of dictionaries with text and position info
@@ -54,8 +353,15 @@ async def perform_ocr(file: UploadFile = File(...)):
             confidence = 0.85  # Default confidence for Pix2Text
         elif isinstance(result, list):
             # Detailed output with positions
-            texts = [item.get('text', '') for item in result if isinstance(item, dict)]
-            full_text = " ".join(texts) if texts else ""
+            text_buf = io.StringIO()
+            first = True
+            for item in result:
+                if isinstance(item, dict):
+                    if not first:
+                        text_buf.write(" ")
+                    text_buf.write(item.get('text', ''))
+                    first = False
+            full_text = text_buf.getvalue()
             latex_text = full_text
             confidence = 0.85
         elif isinstance(result, dict):
@@ -70,14 +376,20 @@ async def perform_ocr(file: UploadFile = File(...)):
 
         processing_time = (time.time() - start_time) * 1000  # ms
 
-        return JSONResponse({
+        response = {
             "engine": "pix2text",
             "text": full_text,
             "latex": latex_text,  # LaTeX representation
             "confidence": confidence,
             "processingTime": processing_time
-        })
+        }
+        if cache_key:
+            await result_cache.set(cache_key, response)
+
+        return ORJSONResponse(response)
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"OCR processing failed: {str(e)}")
 
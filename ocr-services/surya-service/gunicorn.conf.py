@@ -0,0 +1,16 @@
+"""Gunicorn settings: uvicorn workers forked from a preloaded app."""
+
+import os
+
+bind = "0.0.0.0:8000"
+worker_class = "uvicorn.workers.UvicornWorker"
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+# Load the model once in the master and fork workers from it, so read-only
+# weight pages are shared copy-on-write instead of duplicated per worker.
+# CUDA contexts don't survive fork, so GPU deployments load per worker;
+# without USE_GPU=1, main.py hides CUDA devices so the master never opens one.
+preload_app = os.getenv("USE_GPU", "0") != "1"
+
+# Model loading and warmup can block a worker well past the 30s default
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "600"))
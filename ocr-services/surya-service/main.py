@@ -1,13 +1,79 @@
-import importlib.util as importlib_util
-from importlib import import_module
+import os
+
+# Size the OpenMP/MKL/OpenBLAS thread pools so WEB_CONCURRENCY workers x
+# threads roughly matches the available cores, instead of every worker
+# grabbing all of them. This has to run before numpy/torch are imported,
+# since they read these variables at import time.
+_cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+for _var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+    os.environ.setdefault(_var, str(max(1, _cores // int(os.getenv("WEB_CONCURRENCY", "1")))))
+CPU_THREADS = int(os.environ["OMP_NUM_THREADS"])
+
+# Unless USE_GPU=1, hide CUDA devices before torch loads. The engine would
+# otherwise pick a visible GPU by itself, and since CPU deployments preload
+# the app in the gunicorn master (gunicorn.conf.py), CUDA would be
+# initialized there and then forked into the workers.
+if os.getenv("USE_GPU", "0") != "1":
+    os.environ["CUDA_VISIBLE_DEVICES"] = ""
+
+import asyncio
+import contextlib
+import hashlib
 import io
+import importlib.util as importlib_util
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module, metadata
 import time
-from typing import Sequence
+from typing import BinaryIO, Sequence, Tuple
 
 from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from PIL import Image
+from fastapi.responses import ORJSONResponse
+from PIL import Image, UnidentifiedImageError
+from cachetools import LRUCache
+from redis.exceptions import RedisError
+import cv2
+import numpy as np
+import orjson
+import redis.asyncio
+import torch
+
+# Match torch's intra-op pool to CPU_THREADS; inter-op parallelism only adds
+# contention when requests are already serialized through the executor
+torch.set_num_threads(CPU_THREADS)
+torch.set_num_interop_threads(1)
+
+# Inference precision on GPU: 'auto' picks bf16 on Ampere+ (SM80) and fp16
+# otherwise; 'fp32' disables autocast. Ignored on CPU.
+SURYA_PRECISION = os.getenv("SURYA_PRECISION", "auto").lower()
+
+# Execution backend for the detection model: 'torch' (default) or 'trt'
+# (TensorRT FP16 engine, requires CUDA and the tensorrt package).
+SURYA_BACKEND = os.getenv("SURYA_BACKEND", "torch").lower()
+
+# Replay the recognizer's decode step from CUDA graphs (torch.compile
+# "reduce-overhead", one graph per input shape). Graph replay needs fixed
+# shapes, so Surya's static KV cache is switched on as well: it pads every
+# recognition batch to the configured batch size. The setting has been
+# renamed across Surya releases, hence both names.
+SURYA_CUDA_GRAPHS = os.getenv("SURYA_CUDA_GRAPHS", "0") == "1"
+# Upper bound on distinct captured shapes (each holds its own graph memory)
+CUDA_GRAPH_SHAPES = int(os.getenv("SURYA_CUDA_GRAPH_SHAPES", "32"))
+if SURYA_CUDA_GRAPHS:
+    os.environ.setdefault("RECOGNITION_STATIC_CACHE", "true")
+    os.environ.setdefault("FOUNDATION_STATIC_CACHE", "true")
+
+
+def resolve_autocast_dtype(precision: str) -> torch.dtype | None:
+    if precision == "fp32" or not torch.cuda.is_available():
+        return None
+    if precision == "bf16":
+        return torch.bfloat16
+    if precision == "fp16":
+        return torch.float16
+    major, _ = torch.cuda.get_device_capability()
+    return torch.bfloat16 if major >= 8 else torch.float16
 
 
 class SuryaEngine:
@@ -30,6 +96,10 @@ class SuryaEngine:
         self.rec_model = None
         self.rec_processor = None
 
+        self.autocast_dtype: torch.dtype | None = None
+        self.cuda_graphs = False
+        self.capturing = False
+
         self.modern_error: Exception | None = None
         self.initialized = False
 
@@ -37,6 +107,11 @@ class SuryaEngine:
         if self.initialized:
             return
 
+        self.autocast_dtype = resolve_autocast_dtype(SURYA_PRECISION)
+        if self.autocast_dtype is not None:
+            torch.set_float32_matmul_precision("high")
+            print(f"Surya inference precision: {self.autocast_dtype}")
+
         modern_spec = importlib_util.find_spec("surya.models")
         if modern_spec is not None:
             try:
@@ -63,10 +138,80 @@ class SuryaEngine:
 
         self.det_predictor = predictors["detection"]
         self.rec_predictor = predictors["recognition"]
+        if SURYA_BACKEND == "trt":
+            self._enable_tensorrt()
+
+        if self.autocast_dtype is not None:
+            for predictor in predictors.values():
+                foundation = getattr(predictor, "foundation_predictor", None)
+                for owner in (predictor, foundation):
+                    model = getattr(owner, "model", None)
+                    if isinstance(model, torch.nn.Module):
+                        model.to(dtype=self.autocast_dtype)
+
+        if SURYA_CUDA_GRAPHS and torch.cuda.is_available():
+            self._enable_cuda_graphs()
+
         self.task_name = TaskNames.ocr_with_boxes
         self.mode = "modern"
         print("Initialized Surya modern API predictors")
 
+    def _enable_tensorrt(self) -> None:
+        if not torch.cuda.is_available():
+            print("Warning: SURYA_BACKEND=trt requires CUDA; using PyTorch detection")
+            return
+        try:
+            from trt_engine import wrap_detection_model
+
+            self.det_predictor.model = wrap_detection_model(self.det_predictor.model)
+            print("Surya detection running on TensorRT")
+        except Exception as exc:  # pragma: no cover - optional accelerator
+            print(f"Warning: Could not enable TensorRT detection: {exc}")
+
+    def _enable_cuda_graphs(self) -> None:
+        foundation = getattr(self.rec_predictor, "foundation_predictor", None) or self.rec_predictor
+        model = getattr(foundation, "model", None)
+        if not isinstance(model, torch.nn.Module):
+            print("Warning: Surya recognizer model not found; CUDA graphs disabled")
+            return
+        # Patch forward rather than replacing the module so attribute access
+        # and dtype casts on the model keep working.
+        eager = model.forward
+        compiled = torch.compile(eager, mode="reduce-overhead", dynamic=False)
+        captured: set[tuple] = set()
+        torch._dynamo.config.cache_size_limit = max(
+            torch._dynamo.config.cache_size_limit, CUDA_GRAPH_SHAPES
+        )
+
+        def forward(*args, **kwargs):
+            # Graphs are only captured while capture_graphs() runs at startup.
+            # The static KV cache pads every recognition batch to a fixed size,
+            # so the decode step has a single shape that the warmup page
+            # captures. Shapes it didn't see run eagerly instead of stalling a
+            # live request on a recompile (or tripping dynamo's recompile limit).
+            key = tuple(
+                tuple(value.shape)
+                for value in (*args, *kwargs.values())
+                if isinstance(value, torch.Tensor)
+            )
+            if key not in captured:
+                if not self.capturing or len(captured) >= CUDA_GRAPH_SHAPES:
+                    return eager(*args, **kwargs)
+                captured.add(key)
+            return compiled(*args, **kwargs)
+
+        model.forward = forward
+        self.cuda_graphs = True
+        print("Surya recognizer decode step will run from CUDA graphs")
+
+    def capture_graphs(self, image: Image.Image) -> None:
+        """Run one prediction with graph capture enabled (a plain warmup otherwise)."""
+        self.capturing = self.cuda_graphs
+        try:
+            self.predict_batch([image], ["en"])
+        finally:
+            self.capturing = False
+
     def _init_legacy(self) -> None:
         package = None
         run_ocr_module = None
@@ -122,25 +267,35 @@ class SuryaEngine:
             raise RuntimeError("Surya engine is not initialized")
 
     def predict(self, image: Image.Image, langs: Sequence[str]) -> list:
+        return self.predict_batch([image], langs)
+
+    def predict_batch(self, images: Sequence[Image.Image], langs: Sequence[str]) -> list:
+        """Run OCR over several images in one predictor call (one result per image)."""
         self.ensure_models_loaded()
 
-        if self.mode == "modern":
-            task_names = [self.task_name]
-            return self.rec_predictor(
-                [image],
-                task_names=task_names,
-                det_predictor=self.det_predictor,
-                math_mode=True,
+        with torch.inference_mode(), self._autocast():
+            if self.mode == "modern":
+                task_names = [self.task_name] * len(images)
+                return self.rec_predictor(
+                    list(images),
+                    task_names=task_names,
+                    det_predictor=self.det_predictor,
+                    math_mode=True,
+                )
+
+            return self.run_ocr(
+                list(images),
+                [list(langs)] * len(images),
+                self.det_model,
+                self.det_processor,
+                self.rec_model,
+                self.rec_processor,
             )
 
-        return self.run_ocr(
-            [image],
-            [list(langs)],
-            self.det_model,
-            self.det_processor,
-            self.rec_model,
-            self.rec_processor,
-        )
+    def _autocast(self):
+        if self.autocast_dtype is None:
+            return contextlib.nullcontext()
+        return torch.autocast(device_type="cuda", dtype=self.autocast_dtype)
 
     @property
     def models_ready(self) -> bool:
@@ -151,7 +306,282 @@ class SuryaEngine:
         return False
 
 
-app = FastAPI(title="Surya OCR Service", version="1.0.0")
+class RecognitionBatcher:
+    """Coalesces concurrent OCR requests into batched Surya predictor calls.
+
+    Surya's recognizer is a transformer whose per-call launch overhead
+    dominates at batch size 1, so pending images are collected for up to
+    ``window_ms`` (or until ``max_batch`` are queued) and dispatched together.
+    """
+
+    def __init__(self, engine: SuryaEngine, max_batch: int, window_ms: int) -> None:
+        self.engine = engine
+        self.max_batch = max(1, max_batch)
+        self.window = window_ms / 1000
+        self.queue: asyncio.Queue | None = None
+        self.task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self.task is None:
+            self.queue = asyncio.Queue()
+            self.task = asyncio.create_task(self._run())
+
+    async def submit(self, image: Image.Image, langs: Sequence[str]):
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((image, tuple(langs), future))
+        return await future
+
+    async def _collect(self) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await self.queue.get()]
+        deadline = loop.time() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _predict(self, images: list, langs: tuple) -> list:
+        loop = asyncio.get_running_loop()
+        predictions = await loop.run_in_executor(
+            EXECUTOR, self.engine.predict_batch, images, langs
+        )
+        if len(predictions) != len(images):
+            raise RuntimeError(
+                f"Surya returned {len(predictions)} results for {len(images)} images"
+            )
+        return predictions
+
+    async def _dispatch(self, langs: tuple, items: list) -> None:
+        try:
+            predictions = await self._predict([image for image, _, _ in items], langs)
+        except Exception as exc:
+            if len(items) == 1:
+                if not items[0][2].done():
+                    items[0][2].set_exception(exc)
+                return
+            # One bad page (or an OOM at this batch size) shouldn't fail
+            # every request it was coalesced with; retry them one by one.
+            print(f"Warning: Surya batch of {len(items)} failed, retrying individually: {exc}")
+            for item in items:
+                await self._dispatch(langs, [item])
+            return
+
+        for (_, _, future), prediction in zip(items, predictions):
+            if not future.done():
+                future.set_result(prediction)
+
+    async def _run(self) -> None:
+        while True:
+            # Requests whose client already went away are dropped here
+            batch = [item for item in await self._collect() if not item[2].done()]
+
+            # Only images sharing a language list can go in the same call;
+            # anything else is dispatched as its own group.
+            groups: dict[tuple, list] = {}
+            for item in batch:
+                groups.setdefault(item[1], []).append(item)
+
+            for langs, items in groups.items():
+                await self._dispatch(langs, items)
+
+
+# Inference runs on a single dedicated thread so the event loop stays
+# responsive while OCR is in progress. The batcher dispatches one batch at a
+# time, so concurrent requests are coalesced rather than run in parallel.
+BATCH_MAX = int(os.getenv("SURYA_BATCH_MAX", "8"))
+BATCH_WINDOW_MS = int(os.getenv("SURYA_BATCH_WINDOW_MS", "25"))
+
+EXECUTOR = ThreadPoolExecutor(max_workers=1)
+
+# Max requests per worker holding a decoded image (queued in the batcher or
+# being recognized); later ones wait before decoding, so a burst of uploads
+# can't pile up decoded pages in memory. Defaults (also when set empty) to
+# two full batches.
+OCR_MAX_PENDING = int(os.getenv("OCR_MAX_PENDING") or 2 * BATCH_MAX)
+SEM = asyncio.Semaphore(max(1, OCR_MAX_PENDING))
+
+# Run a synthetic inference at startup (set OCR_WARMUP=0 to skip)
+OCR_WARMUP = os.getenv("OCR_WARMUP", "1") == "1"
+
+# Reject images above this many pixels before decoding (413); also replaces
+# PIL's decompression-bomb check, which would otherwise surface as a 500
+MAX_PIXELS = int(os.getenv("OCR_MAX_PIXELS", "50000000"))
+Image.MAX_IMAGE_PIXELS = None
+
+# Downscale uploads whose long edge exceeds this before OCR (0 disables).
+# The engines resize internally anyway; shrinking first avoids converting
+# and copying full-resolution scans.
+MAX_EDGE = int(os.getenv("OCR_MAX_EDGE", "1600"))
+
+# Keep OpenCV's own thread pool from competing with inference threads
+cv2.setNumThreads(1)
+
+# Cache OCR results by image content hash so retried or re-queued pages skip
+# inference. Uses Redis (shared across workers) when REDIS_URL is set,
+# otherwise a per-process LRU. Keys include the engine version, backend,
+# precision and decode settings, so changing any of them invalidates old
+# entries.
+OCR_CACHE = os.getenv("OCR_CACHE", "1") == "1"
+OCR_CACHE_SIZE = int(os.getenv("OCR_CACHE_SIZE", "4096"))
+OCR_CACHE_TTL = int(os.getenv("OCR_CACHE_TTL", "86400"))
+REDIS_URL = os.getenv("REDIS_URL")
+# After a Redis error, skip it for this many seconds instead of paying the
+# connect/read timeout on every request while it is down
+REDIS_BACKOFF = float(os.getenv("REDIS_BACKOFF", "30"))
+
+
+class ResultCache:
+    """OCR responses keyed by a BLAKE2b hash of the uploaded bytes."""
+
+    def __init__(self, namespace: str) -> None:
+        self.namespace = namespace
+        self.local = LRUCache(maxsize=max(1, OCR_CACHE_SIZE))
+        self.redis = (
+            redis.asyncio.from_url(REDIS_URL, socket_connect_timeout=1, socket_timeout=1)
+            if REDIS_URL else None
+        )
+        self.redis_retry_at = 0.0
+
+    def redis_available(self) -> bool:
+        return self.redis is not None and time.monotonic() >= self.redis_retry_at
+
+    def redis_failed(self, action: str, error: RedisError) -> None:
+        print(f"Warning: Redis cache {action} failed, bypassing it for {REDIS_BACKOFF:.0f}s: {error}")
+        self.redis_retry_at = time.monotonic() + REDIS_BACKOFF
+
+    def key(self, upload: BinaryIO) -> str:
+        digest = hashlib.blake2b(digest_size=16)
+        for chunk in iter(lambda: upload.read(1 << 20), b""):
+            digest.update(chunk)
+        upload.seek(0)
+        return f"{self.namespace}:{digest.hexdigest()}"
+
+    async def get(self, key: str) -> dict | None:
+        payload = None
+        if self.redis_available():
+            try:
+                payload = await self.redis.get(key)
+            except RedisError as exc:
+                self.redis_failed("read", exc)
+        if payload is None:
+            payload = self.local.get(key)
+        return orjson.loads(payload) if payload is not None else None
+
+    async def set(self, key: str, result: dict) -> None:
+        payload = orjson.dumps(result, option=orjson.OPT_SERIALIZE_NUMPY)
+        if self.redis_available():
+            try:
+                await self.redis.set(key, payload, ex=OCR_CACHE_TTL)
+                return
+            except RedisError as exc:
+                self.redis_failed("write", exc)
+        self.local[key] = payload
+
+
+result_cache = ResultCache(
+    f"ocr:v2:surya:{metadata.version('surya-ocr')}:{SURYA_BACKEND}"
+    f":{str(resolve_autocast_dtype(SURYA_PRECISION)).removeprefix('torch.')}:{MAX_EDGE}"
+)
+
+
+def check_pixel_limit(width: int, height: int) -> None:
+    if width * height > MAX_PIXELS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Image too large: {width}x{height} exceeds {MAX_PIXELS} pixels",
+        )
+
+
+def reduced_imread_flag(width: int, height: int) -> int:
+    """Pick the largest JPEG DCT-domain reduction (1/2, 1/4, 1/8) that keeps the long edge >= MAX_EDGE."""
+    long_edge = max(width, height)
+    for factor, flag in (
+        (8, cv2.IMREAD_REDUCED_COLOR_8),
+        (4, cv2.IMREAD_REDUCED_COLOR_4),
+        (2, cv2.IMREAD_REDUCED_COLOR_2),
+    ):
+        if long_edge // factor >= MAX_EDGE:
+            return flag
+    return cv2.IMREAD_COLOR
+
+
+def fit_to_max_edge(img_array: np.ndarray) -> np.ndarray:
+    """Downscale so the long edge is at most MAX_EDGE."""
+    height, width = img_array.shape[:2]
+    scale = MAX_EDGE / max(height, width)
+    if scale >= 1.0:
+        return img_array
+    return cv2.resize(
+        img_array,
+        (int(width * scale), int(height * scale)),
+        interpolation=cv2.INTER_AREA,
+    )
+
+
+def decode_image(upload: BinaryIO) -> Tuple[Image.Image, Tuple[int, int]]:
+    """Decode an uploaded image file into an RGB PIL image, downscaled to MAX_EDGE.
+
+    Also returns the original (width, height) so boxes can be mapped back.
+    """
+    # Opening with PIL only parses the header, so oversized images are
+    # rejected before any pixel buffer is allocated
+    try:
+        image = Image.open(upload)
+        check_pixel_limit(*image.size)
+    except UnidentifiedImageError:
+        image = None
+
+    # OpenCV decodes JPEG/PNG straight into a contiguous array in one C call.
+    # Large JPEGs are shrunk during decode via libjpeg's DCT scaling, which is
+    # essentially free compared to decoding at full size and resizing. The
+    # array is then wrapped in PIL rather than decoded a second time
+    flag = cv2.IMREAD_COLOR
+    if MAX_EDGE and image is not None and image.format == "JPEG":
+        flag = reduced_imread_flag(*image.size)
+    upload.seek(0)
+    # Leave EXIF orientation alone, as PIL did before: pixels (and boxes)
+    # stay in the stored frame and match the header size read above
+    img_array = cv2.imdecode(
+        np.frombuffer(upload.read(), np.uint8), flag | cv2.IMREAD_IGNORE_ORIENTATION
+    )
+    if img_array is not None:
+        if image is None:
+            check_pixel_limit(img_array.shape[1], img_array.shape[0])
+        original_size = image.size if image is not None else (img_array.shape[1], img_array.shape[0])
+        if MAX_EDGE:
+            img_array = fit_to_max_edge(img_array)
+        return Image.fromarray(cv2.cvtColor(img_array, cv2.COLOR_BGR2RGB)), original_size
+
+    if image is None:
+        raise ValueError("Unsupported image format")
+
+    # Fall back to PIL for formats OpenCV can't read (e.g., GIF)
+    original_size = image.size
+    if image.format == "JPEG":
+        # Have libjpeg-turbo emit RGB (and downscale, if oversized) while decoding
+        image.draft("RGB", (MAX_EDGE, MAX_EDGE) if MAX_EDGE else image.size)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+
+    scale = MAX_EDGE / max(image.size) if MAX_EDGE else 1.0
+    if scale < 1.0:
+        image = image.resize(
+            (int(image.width * scale), int(image.height * scale)), Image.LANCZOS
+        )
+    return image, original_size
+
+
+app = FastAPI(
+    title="Surya OCR Service",
+    version="1.0.0",
+    default_response_class=ORJSONResponse,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -162,6 +592,37 @@ app.add_middleware(
 )
 
 surya_engine = SuryaEngine()
+batcher = RecognitionBatcher(surya_engine, BATCH_MAX, BATCH_WINDOW_MS)
+
+# Load weights at import so gunicorn --preload (CPU deployments) shares them
+# copy-on-write across forked workers. CUDA contexts don't survive fork, so
+# with USE_GPU=1 each worker loads in its startup hook instead.
+if os.getenv("USE_GPU", "0") != "1":
+    try:
+        surya_engine.ensure_models_loaded()
+    except Exception as exc:  # pragma: no cover - retried in the startup hook
+        print(f"Warning: Could not preload Surya models: {exc}")
+
+
+@app.on_event("startup")
+async def check_exif_orientation() -> None:
+    """Make sure decode_image keeps EXIF-rotated JPEGs in the frame it reports.
+
+    Decodes a JPEG tagged orientation 6 (rotate 90 degrees); if the decoded
+    frame and the reported original size disagree, boxes on rotated phone
+    photos would be rescaled wrongly, so refuse to start.
+    """
+    buf = io.BytesIO()
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    Image.new("RGB", (64, 32), "white").save(buf, "JPEG", exif=exif.tobytes())
+    buf.seek(0)
+    image, (orig_width, orig_height) = decode_image(buf)
+    if (image.width > image.height) != (orig_width > orig_height):
+        raise RuntimeError(
+            f"decode_image applied EXIF rotation: decoded {image.width}x{image.height}, "
+            f"reported original {orig_width}x{orig_height}"
+        )
 
 
 @app.on_event("startup")
@@ -171,6 +632,35 @@ async def load_models() -> None:
         print("Surya models loaded successfully")
     except Exception as exc:  # pragma: no cover - operational logging
         print(f"Warning: Could not load Surya models: {exc}")
+    else:
+        if OCR_WARMUP:
+            await warmup()
+    batcher.start()
+
+
+def warmup_image() -> Image.Image:
+    """A white page with a few printed lines, so warmup reaches the recognizer, not just detection."""
+    page = np.full((640, 640, 3), 255, dtype=np.uint8)
+    for row, line in enumerate(("The quick brown fox", "jumps over the lazy dog", "x = (a + b) / 2")):
+        cv2.putText(
+            page, line, (32, 160 + row * 100), cv2.FONT_HERSHEY_SIMPLEX, 1.0, (0, 0, 0), 2, cv2.LINE_AA
+        )
+    return Image.fromarray(page)
+
+
+async def warmup() -> None:
+    """Run a synthetic inference so CUDA init and kernel autotuning happen before the first request."""
+    if torch.cuda.is_available():
+        torch.backends.cudnn.benchmark = True
+    start_time = time.time()
+    try:
+        loop = asyncio.get_running_loop()
+        page = warmup_image()
+        # With CUDA graphs on, this also captures the recognizer's decode step
+        await loop.run_in_executor(EXECUTOR, surya_engine.capture_graphs, page)
+        print(f"Surya warmup finished in {(time.time() - start_time) * 1000:.0f} ms")
+    except Exception as exc:  # pragma: no cover - operational logging
+        print(f"Warning: Surya warmup failed: {exc}")
 
 
 @app.post("/ocr")
@@ -182,46 +672,67 @@ async def perform_ocr(file: UploadFile = File(...)):
     start_time = time.time()
 
     try:
-        contents = await file.read()
-        image = Image.open(io.BytesIO(contents))
-        if image.mode != "RGB":
-            image = image.convert("RGB")
-
-        predictions = surya_engine.predict(image, langs=["en"])
-
-        texts: list[str] = []
-        confidences: list[float] = []
-        lines_data: list[dict] = []
-
-        if predictions:
-            pred = predictions[0]
-            for text_line in getattr(pred, "text_lines", []):
-                text = getattr(text_line, "text", "")
-                confidence = getattr(text_line, "confidence", 0.85)
-                texts.append(text)
-                confidences.append(confidence)
-                bbox = getattr(text_line, "bbox", [])
-                lines_data.append(
-                    {
-                        "text": text,
-                        "confidence": confidence,
-                        "bbox": bbox,
-                    }
-                )
+        # Identical uploads (retries, re-queued pages) are served from cache;
+        # hashing reads the whole upload, so it runs in the threadpool too
+        cache_key = await run_in_threadpool(result_cache.key, file.file) if OCR_CACHE else None
+        cached = await result_cache.get(cache_key) if cache_key else None
+        if cached is not None:
+            cached["cached"] = True
+            cached["processingTime"] = (time.time() - start_time) * 1000
+            return ORJSONResponse(cached)
+
+        async with SEM:
+            # Uploads over 1 MB are spooled to disk, and decoding a large page
+            # takes a while, so read and decode off the event loop
+            image, (orig_width, orig_height) = await run_in_threadpool(decode_image, file.file)
+            pred = await batcher.submit(image, langs=["en"])
+
+        # Report boxes in the uploaded image's coordinates, not the
+        # downscaled copy OCR ran on
+        scale_x = orig_width / image.width
+        scale_y = orig_height / image.height
+
+        text_lines = getattr(pred, "text_lines", []) if pred is not None else []
+
+        # Single pass: combined text, running confidence sum, line records
+        text_buf = io.StringIO()
+        conf_sum = 0.0
+        lines_data = []
+        for i, text_line in enumerate(text_lines):
+            text = getattr(text_line, "text", "")
+            confidence = getattr(text_line, "confidence", 0.85)
+            if i:
+                text_buf.write(" ")
+            text_buf.write(text)
+            conf_sum += confidence
+            lines_data.append(
+                {
+                    "text": text,
+                    "confidence": confidence,
+                    "bbox": [
+                        coord * (scale_y if axis % 2 else scale_x)
+                        for axis, coord in enumerate(getattr(text_line, "bbox", []))
+                    ],
+                }
+            )
 
-        full_text = " ".join(texts) if texts else ""
-        avg_confidence = sum(confidences) / len(confidences) if confidences else 0.0
+        full_text = text_buf.getvalue()
+        avg_confidence = conf_sum / len(lines_data) if lines_data else 0.0
         processing_time = (time.time() - start_time) * 1000
 
-        return JSONResponse(
-            {
-                "engine": "surya",
-                "text": full_text,
-                "confidence": avg_confidence,
-                "processingTime": processing_time,
-                "lines": lines_data,
-            }
-        )
+        response = {
+            "engine": "surya",
+            "text": full_text,
+            "confidence": avg_confidence,
+            "processingTime": processing_time,
+            "lines": lines_data,
+        }
+        if cache_key:
+            await result_cache.set(cache_key, response)
+
+        return ORJSONResponse(response)
+    except HTTPException:
+        raise
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"OCR processing failed: {exc}") from exc
 
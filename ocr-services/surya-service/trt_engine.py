@@ -0,0 +1,193 @@
+"""
+TensorRT execution path for Surya's text detection model.
+
+The detection network is a fixed-op convolutional segmenter over padded
+page crops, which makes it a good TensorRT target. The torch module is
+exported to ONNX once, compiled to an FP16 engine, and the engine is cached
+per GPU architecture, TensorRT version and surya-ocr release so later starts
+only deserialize it (and upgrades rebuild instead of loading stale weights).
+
+Recognition stays on PyTorch: it decodes autoregressively with a KV cache,
+which does not map onto a single static engine.
+"""
+
+import fcntl
+import hashlib
+import os
+from importlib import metadata
+from pathlib import Path
+from types import SimpleNamespace
+
+import torch
+
+CACHE_DIR = Path(os.getenv("SURYA_TRT_CACHE", Path.home() / ".cache" / "surya"))
+
+# Optimization profile for (batch, channels, height, width)
+PROFILE_MIN = (1, 3, 32, 32)
+PROFILE_OPT = (8, 3, 640, 640)
+PROFILE_MAX = (16, 3, 1280, 1280)
+
+INPUT_NAME = "pixel_values"
+OUTPUT_NAME = "logits"
+
+
+class _LogitsOnly(torch.nn.Module):
+    """Unwraps the HuggingFace-style output so ONNX export sees a plain tensor."""
+
+    def __init__(self, model: torch.nn.Module) -> None:
+        super().__init__()
+        self.model = model
+
+    def forward(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        return self.model(pixel_values=pixel_values).logits
+
+
+def _engine_tag(model: torch.nn.Module, trt_version: str) -> str:
+    """Identify the weights and toolchain an engine was built from."""
+    checkpoint = str(getattr(getattr(model, "config", None), "_name_or_path", ""))
+    source = f"{metadata.version('surya-ocr')}:{checkpoint}:{trt_version}"
+    return hashlib.blake2b(source.encode(), digest_size=6).hexdigest()
+
+
+def in_profile(shape: tuple) -> bool:
+    """Whether an input shape falls inside the engine's optimization profile."""
+    return len(shape) == len(PROFILE_MIN) and all(
+        low <= dim <= high for low, dim, high in zip(PROFILE_MIN, shape, PROFILE_MAX)
+    )
+
+
+class TRTInferSession:
+    """Builds (or loads) a cached FP16 TensorRT engine and runs it on CUDA tensors."""
+
+    def __init__(self, model: torch.nn.Module, name: str) -> None:
+        import tensorrt as trt
+
+        self.trt = trt
+        self.logger = trt.Logger(trt.Logger.WARNING)
+
+        major, minor = torch.cuda.get_device_capability()
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tag = _engine_tag(model, trt.__version__)
+        self.engine_path = CACHE_DIR / f"{name}_sm{major}{minor}_fp16_{tag}.engine"
+
+        if not self.engine_path.exists():
+            # Each GPU worker loads its own copy of the model, so serialize
+            # builds across processes; the loser of the race finds the
+            # finished engine once it gets the lock
+            with open(CACHE_DIR / f"{name}.lock", "w") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                if not self.engine_path.exists():
+                    onnx_path = CACHE_DIR / f"{name}_{tag}.{os.getpid()}.onnx"
+                    try:
+                        self._export_onnx(model, onnx_path)
+                        self._build_engine(onnx_path)
+                    finally:
+                        onnx_path.unlink(missing_ok=True)
+
+        runtime = trt.Runtime(self.logger)
+        self.engine = runtime.deserialize_cuda_engine(self.engine_path.read_bytes())
+        if self.engine is None:
+            raise RuntimeError(f"Failed to load TensorRT engine: {self.engine_path}")
+        self.context = self.engine.create_execution_context()
+        self.stream = torch.cuda.Stream()
+        self.pinned: torch.Tensor | None = None
+
+    def _export_onnx(self, model: torch.nn.Module, onnx_path: Path) -> None:
+        device = next(model.parameters()).device
+        dummy = torch.zeros(PROFILE_OPT, device=device, dtype=torch.float32)
+        with torch.no_grad():
+            torch.onnx.export(
+                _LogitsOnly(model).eval(),
+                (dummy,),
+                str(onnx_path),
+                input_names=[INPUT_NAME],
+                output_names=[OUTPUT_NAME],
+                dynamic_axes={
+                    INPUT_NAME: {0: "batch", 2: "H", 3: "W"},
+                    OUTPUT_NAME: {0: "batch", 2: "H", 3: "W"},
+                },
+                opset_version=17,
+            )
+
+    def _build_engine(self, onnx_path: Path) -> None:
+        trt = self.trt
+        builder = trt.Builder(self.logger)
+        network = builder.create_network(
+            1 << int(trt.NetworkDefinitionCreationFlag.EXPLICIT_BATCH)
+        )
+        parser = trt.OnnxParser(network, self.logger)
+        if not parser.parse(onnx_path.read_bytes()):
+            errors = "; ".join(str(parser.get_error(i)) for i in range(parser.num_errors))
+            raise RuntimeError(f"ONNX parse failed: {errors}")
+
+        config = builder.create_builder_config()
+        config.set_flag(trt.BuilderFlag.FP16)
+        profile = builder.create_optimization_profile()
+        profile.set_shape(INPUT_NAME, PROFILE_MIN, PROFILE_OPT, PROFILE_MAX)
+        config.add_optimization_profile(profile)
+
+        serialized = builder.build_serialized_network(network, config)
+        if serialized is None:
+            raise RuntimeError("TensorRT engine build failed")
+        # Write-then-rename so a crash mid-write never leaves a truncated engine
+        partial = self.engine_path.with_suffix(f".{os.getpid()}.tmp")
+        partial.write_bytes(bytes(serialized))
+        os.replace(partial, self.engine_path)
+        print(f"Built TensorRT engine: {self.engine_path}")
+
+    def _to_device(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        pixel_values = pixel_values.float().contiguous()
+        if pixel_values.is_cuda:
+            return pixel_values
+
+        # Stage host input through a reusable pinned buffer for faster H2D copies
+        if self.pinned is None or self.pinned.numel() < pixel_values.numel():
+            self.pinned = torch.empty(pixel_values.numel(), dtype=torch.float32).pin_memory()
+        staged = self.pinned[: pixel_values.numel()].view(pixel_values.shape)
+        staged.copy_(pixel_values)
+        return staged.to("cuda", non_blocking=True)
+
+    def __call__(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        with torch.cuda.stream(self.stream):
+            inputs = self._to_device(pixel_values)
+            if not self.context.set_input_shape(INPUT_NAME, tuple(inputs.shape)):
+                raise ValueError(
+                    f"Input shape {tuple(inputs.shape)} is outside the TensorRT profile"
+                )
+            outputs = torch.empty(
+                tuple(self.context.get_tensor_shape(OUTPUT_NAME)),
+                dtype=torch.float32,
+                device="cuda",
+            )
+            self.context.set_tensor_address(INPUT_NAME, inputs.data_ptr())
+            self.context.set_tensor_address(OUTPUT_NAME, outputs.data_ptr())
+            self.context.execute_async_v3(self.stream.cuda_stream)
+        self.stream.synchronize()
+        return outputs
+
+
+class TRTDetectionModel:
+    """Drop-in replacement for a Surya detection model backed by TensorRT.
+
+    Attribute access (config, device, dtype, ...) falls through to the
+    original torch module so the predictor's pre/post-processing is unchanged.
+    """
+
+    def __init__(self, model: torch.nn.Module, session: TRTInferSession) -> None:
+        self._model = model
+        self._session = session
+
+    def __call__(self, pixel_values: torch.Tensor, **kwargs: object) -> SimpleNamespace:
+        # Batches or pages beyond the optimization profile (the predictor's
+        # own batching can exceed PROFILE_MAX) run on the torch model instead
+        if not in_profile(tuple(pixel_values.shape)):
+            return self._model(pixel_values=pixel_values, **kwargs)
+        logits = self._session(pixel_values)
+        return SimpleNamespace(logits=logits.to(pixel_values.device))
+
+    def __getattr__(self, name: str):
+        return getattr(self._model, name)
+
+
+def wrap_detection_model(model: torch.nn.Module) -> TRTDetectionModel:
+    return TRTDetectionModel(model, TRTInferSession(model, "detection"))
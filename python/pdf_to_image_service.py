@@ -5,15 +5,32 @@ PDF to Image Conversion Service
 Uses PyMuPDF (fitz) for high-quality PDF-to-image conversion.
 This solves the pdfjs-dist rendering issues in Node.js.
 
+Runs as a long-lived HTTP service so Python startup and PyMuPDF import
+are paid once, with recently seen PDFs kept open between requests. The CLI
+forwards to a running service and falls back to converting in-process.
+
 Usage:
-    python pdf_to_image_service.py <pdf_path> [--dpi 300] [--format png]
+    python pdf_to_image_service.py --serve [--port 8010]
+    python pdf_to_image_service.py <pdf_path> [--dpi 300] [--format png] [--local]
 """
 
+import os
+import shutil
 import sys
 import json
 import base64
+import hashlib
+import multiprocessing
+import tempfile
+import urllib.error
+import urllib.request
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
-from typing import List, Optional
+from typing import Iterator, List, Optional, Union
+from urllib.parse import urlencode
 import argparse
 
 try:
@@ -22,6 +39,82 @@ except ImportError:
     print("ERROR: PyMuPDF not installed. Run: pip install PyMuPDF", file=sys.stderr)
     sys.exit(1)
 
+# Optional: numpy, for handing pages to in-process OCR as arrays
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Optional: libjpeg-turbo bindings for faster JPEG encoding
+# (pip install PyTurboJPEG numpy; needs the libturbojpeg system library)
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB, TJSAMP_420
+except ImportError:
+    TurboJPEG = None
+
+# libjpeg-turbo pages are encoded at quality 90 (visually lossless for OCR
+# input, noticeably smaller); MuPDF's fallback keeps the original 95 so
+# output is unchanged where libturbojpeg isn't installed
+JPEG_QUALITY = 90
+MUPDF_JPEG_QUALITY = 95
+
+_turbo_jpeg = None
+
+
+def _get_turbo_jpeg() -> Optional["TurboJPEG"]:
+    """Lazily load libturbojpeg once per process; None if unavailable."""
+    global _turbo_jpeg, TurboJPEG
+    if _turbo_jpeg is None and TurboJPEG is not None:
+        try:
+            _turbo_jpeg = TurboJPEG()
+        except (OSError, RuntimeError) as e:
+            print(f"WARNING: libturbojpeg unavailable, using MuPDF encoder: {e}", file=sys.stderr)
+            TurboJPEG = None
+    return _turbo_jpeg
+
+
+# PDFs this short render faster serially than it takes to start workers
+SERIAL_PAGE_LIMIT = 2
+
+
+def _pixmap_to_array(pix: "fitz.Pixmap") -> "np.ndarray":
+    """View a pixmap's samples as an (H, W, channels) uint8 array without copying."""
+    return np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+
+
+def _encode_pixmap(pix: "fitz.Pixmap", output_format: str) -> bytes:
+    """Encode a rendered pixmap as PNG or JPEG bytes."""
+    if output_format.lower() == "png":
+        return pix.tobytes("png")
+    elif output_format.lower() in ["jpg", "jpeg"]:
+        turbo = _get_turbo_jpeg()
+        if turbo is not None and pix.n == 3:
+            # libjpeg-turbo's SIMD DCT is considerably faster than MuPDF's encoder
+            return turbo.encode(
+                _pixmap_to_array(pix),
+                quality=JPEG_QUALITY,
+                pixel_format=TJPF_RGB,
+                jpeg_subsample=TJSAMP_420,
+            )
+        return pix.tobytes("jpeg", jpg_quality=MUPDF_JPEG_QUALITY)
+    else:
+        raise ValueError(f"Unsupported format: {output_format}")
+
+
+def _render_page(pdf_path: str, page_num: int, zoom: float, output_format: str) -> bytes:
+    """
+    Render a single page in a worker process.
+
+    Each worker opens its own document: MuPDF handles can't be shared
+    across processes.
+    """
+    doc = fitz.open(pdf_path)
+    try:
+        pix = doc[page_num].get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+        return _encode_pixmap(pix, output_format)
+    finally:
+        doc.close()
+
 
 def pdf_to_images(
     pdf_path: str,
@@ -31,6 +124,9 @@ def pdf_to_images(
     """
     Convert PDF to list of image buffers.
 
+    Pages are rasterized in parallel across CPU cores; very short PDFs are
+    rendered serially to avoid worker startup overhead.
+
     Args:
         pdf_path: Path to PDF file
         dpi: Resolution (default 300)
@@ -39,39 +135,96 @@ def pdf_to_images(
     Returns:
         List of image buffers (one per page)
     """
-    images = []
-
     try:
-        # Open PDF
-        doc = fitz.open(pdf_path)
+        if output_format.lower() not in ["png", "jpg", "jpeg"]:
+            raise ValueError(f"Unsupported format: {output_format}")
 
         # Calculate zoom for desired DPI (default PDF is 72 DPI)
         zoom = dpi / 72
-        mat = fitz.Matrix(zoom, zoom)
 
-        # Convert each page
-        for page_num in range(doc.page_count):
-            page = doc[page_num]
+        doc = fitz.open(pdf_path)
+        page_count = doc.page_count
 
-            # Render page to pixmap (image)
-            pix = page.get_pixmap(matrix=mat, alpha=False)
+        if page_count <= SERIAL_PAGE_LIMIT:
+            mat = fitz.Matrix(zoom, zoom)
+            images = []
+            for page_num in range(page_count):
+                # Render page to pixmap (image)
+                pix = doc[page_num].get_pixmap(matrix=mat, alpha=False)
+                images.append(_encode_pixmap(pix, output_format))
+            doc.close()
+            return images
 
-            # Convert to bytes
-            if output_format.lower() == "png":
-                img_bytes = pix.tobytes("png")
-            elif output_format.lower() in ["jpg", "jpeg"]:
-                img_bytes = pix.tobytes("jpeg", jpg_quality=95)
-            else:
-                raise ValueError(f"Unsupported format: {output_format}")
+        doc.close()
 
-            images.append(img_bytes)
+        # fork is only safe (and the default) on Linux; use spawn elsewhere
+        start_method = "fork" if sys.platform.startswith("linux") else "spawn"
+        workers = min(os.cpu_count() or 1, page_count)
+        # Small chunks keep every worker busy on mid-sized PDFs while still
+        # batching pickling overhead on long ones
+        chunksize = max(1, page_count // (workers * 4))
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context(start_method),
+        ) as executor:
+            return list(executor.map(
+                _render_page,
+                repeat(pdf_path),
+                range(page_count),
+                repeat(zoom),
+                repeat(output_format),
+                chunksize=chunksize,
+            ))
+
+    except Exception as e:
+        raise Exception(f"PDF conversion failed: {str(e)}")
 
-        doc.close()
-        return images
 
+def pdf_to_arrays(
+    pdf_path: str,
+    dpi: int = 300,
+    encode: bool = False,
+    output_format: str = "png"
+) -> Iterator[Union["np.ndarray", bytes]]:
+    """
+    Render PDF pages one at a time for an in-process consumer.
+
+    By default each page is yielded as an (H, W, 3) RGB uint8 array built
+    straight from the pixmap samples, skipping the PNG/JPEG encode (and the
+    consumer's decode) that pdf_to_images pays for. The arrays are read-only.
+
+    Args:
+        pdf_path: Path to PDF file
+        dpi: Resolution (default 300)
+        encode: Yield encoded image bytes instead of arrays (for callers that
+            hand pages across a process or HTTP boundary)
+        output_format: 'png' or 'jpeg' when encode is set
+
+    Yields:
+        One array (or image buffer) per page
+    """
+    if not encode and np is None:
+        raise ImportError("numpy is required for pdf_to_arrays. Run: pip install numpy")
+
+    try:
+        doc = fitz.open(pdf_path)
     except Exception as e:
         raise Exception(f"PDF conversion failed: {str(e)}")
 
+    try:
+        zoom = dpi / 72
+        mat = fitz.Matrix(zoom, zoom)
+        for page in doc:
+            # alpha=False guarantees 3 RGB channels
+            pix = page.get_pixmap(matrix=mat, alpha=False)
+            if encode:
+                yield _encode_pixmap(pix, output_format)
+            else:
+                # pix.samples is a copy, so the array outlives the pixmap
+                yield np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+    finally:
+        doc.close()
+
 
 def pdf_page_count(pdf_path: str) -> int:
     """Get number of pages in PDF."""
@@ -84,16 +237,244 @@ def pdf_page_count(pdf_path: str) -> int:
         raise Exception(f"Failed to get page count: {str(e)}")
 
 
+# --- HTTP service ---------------------------------------------------------
+
+SERVICE_PORT = int(os.getenv("PDF_SERVICE_PORT", "8010"))
+SERVICE_URL = os.getenv("PDF_SERVICE_URL", f"http://localhost:{SERVICE_PORT}")
+SERVICE_WORKERS = int(os.getenv("PDF_SERVICE_WORKERS", str(os.cpu_count() or 1)))
+DOC_CACHE_SIZE = int(os.getenv("PDF_DOC_CACHE_SIZE", "16"))
+
+MEDIA_TYPES = {"png": "image/png", "jpg": "image/jpeg", "jpeg": "image/jpeg"}
+
+
+class DocumentCache:
+    """
+    LRU of opened PDFs keyed by the SHA-1 of their bytes.
+
+    Each render worker process keeps its own: MuPDF handles can't be shared
+    across processes, and PyMuPDF must not be used from several threads.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = max(1, maxsize)
+        self._docs: "OrderedDict[str, fitz.Document]" = OrderedDict()
+
+    def get(self, key: str, pdf_path: str) -> "fitz.Document":
+        doc = self._docs.get(key)
+        if doc is not None:
+            self._docs.move_to_end(key)
+            return doc
+
+        doc = fitz.open(pdf_path)
+        self._docs[key] = doc
+        while len(self._docs) > self.maxsize:
+            _, evicted = self._docs.popitem(last=False)
+            evicted.close()
+        return doc
+
+
+_worker_docs: Optional[DocumentCache] = None
+
+
+def _cached_document(key: str, pdf_path: str) -> "fitz.Document":
+    global _worker_docs
+    if _worker_docs is None:
+        _worker_docs = DocumentCache(DOC_CACHE_SIZE)
+    return _worker_docs.get(key, pdf_path)
+
+
+def _service_page_count(key: str, pdf_path: str) -> int:
+    return _cached_document(key, pdf_path).page_count
+
+
+def _service_render_page(
+    key: str, pdf_path: str, page_num: int, zoom: float, output_format: str
+) -> bytes:
+    """Render one page in a service worker, reusing its open document."""
+    pix = _cached_document(key, pdf_path)[page_num].get_pixmap(
+        matrix=fitz.Matrix(zoom, zoom), alpha=False
+    )
+    return _encode_pixmap(pix, output_format)
+
+
+def _remove_file(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def create_app():
+    """
+    Build the FastAPI app (uvicorn pdf_to_image_service:create_app --factory).
+
+    POST /convert takes a multipart PDF upload and streams the rendered pages
+    back as multipart/mixed, one part per page, so the full page list is
+    never held in memory. Pages are rendered in parallel by a pool of
+    PDF_SERVICE_WORKERS processes, each keeping recently seen PDFs open.
+    """
+    from fastapi import FastAPI, File, HTTPException, Query, UploadFile
+    from fastapi.responses import StreamingResponse
+
+    app = FastAPI(title="PDF to Image Service", version="1.0.0")
+    workers = max(1, SERVICE_WORKERS)
+    # spawn rather than fork: the server process already runs threads
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+    )
+    # Pages rendered ahead of the one being streamed: keeps every worker
+    # busy without buffering whole documents
+    render_ahead = workers * 2
+    # Uploads are written here for the workers to open; anything a dropped
+    # connection left behind goes when the service stops
+    spool_dir = tempfile.mkdtemp(prefix="pdf-service-")
+
+    @app.on_event("shutdown")
+    def shutdown_pool():
+        pool.shutdown(cancel_futures=True)
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+    # Sync handler: FastAPI runs it in its threadpool, so reading the upload
+    # and waiting on the workers never blocks the event loop
+    @app.post("/convert")
+    def convert(
+        file: UploadFile = File(...),
+        dpi: int = Query(300, ge=18, le=1200),
+        format: str = Query("png"),
+    ):
+        output_format = format.lower()
+        if output_format not in MEDIA_TYPES:
+            raise HTTPException(status_code=400, detail=f"Unsupported format: {format}")
+
+        # Workers open the PDF by path; the content hash lets them reuse a
+        # document they already have open from an earlier request
+        pdf_bytes = file.file.read()
+        key = hashlib.sha1(pdf_bytes).hexdigest()
+        fd, pdf_path = tempfile.mkstemp(suffix=".pdf", dir=spool_dir)
+        with os.fdopen(fd, "wb") as f:
+            f.write(pdf_bytes)
+
+        try:
+            page_count = pool.submit(_service_page_count, key, pdf_path).result()
+        except Exception as e:
+            _remove_file(pdf_path)
+            raise HTTPException(status_code=400, detail=f"Failed to open PDF: {str(e)}")
+
+        boundary = uuid.uuid4().hex
+        zoom = dpi / 72
+
+        def submit(page_num: int) -> Future:
+            return pool.submit(
+                _service_render_page, key, pdf_path, page_num, zoom, output_format
+            )
+
+        def render_pages() -> Iterator[bytes]:
+            pending = deque(submit(n) for n in range(min(render_ahead, page_count)))
+            try:
+                for page_num in range(page_count):
+                    img_bytes = pending.popleft().result()
+                    if page_num + len(pending) + 1 < page_count:
+                        pending.append(submit(page_num + len(pending) + 1))
+                    headers = (
+                        f"--{boundary}\r\n"
+                        f"Content-Type: {MEDIA_TYPES[output_format]}\r\n"
+                        f"Content-Length: {len(img_bytes)}\r\n"
+                        f"X-Page-Number: {page_num + 1}\r\n\r\n"
+                    )
+                    yield headers.encode() + img_bytes + b"\r\n"
+                yield f"--{boundary}--\r\n".encode()
+            finally:
+                for future in pending:
+                    future.cancel()
+                _remove_file(pdf_path)
+
+        return StreamingResponse(
+            render_pages(),
+            media_type=f"multipart/mixed; boundary={boundary}",
+            headers={"X-Page-Count": str(page_count)},
+        )
+
+    @app.get("/health")
+    async def health_check():
+        """Health check endpoint"""
+        return {"status": "healthy", "service": "pdf-to-image"}
+
+    return app
+
+
+def _parse_multipart(payload: bytes, boundary: str) -> List[bytes]:
+    """Split a multipart/mixed body into its part bodies."""
+    parts = []
+    for chunk in payload.split(f"--{boundary}".encode())[1:]:
+        if chunk.startswith(b"--"):
+            break
+        _, _, body = chunk.partition(b"\r\n\r\n")
+        parts.append(body[:-2] if body.endswith(b"\r\n") else body)
+    return parts
+
+
+def convert_via_service(
+    pdf_path: str,
+    dpi: int = 300,
+    output_format: str = "png"
+) -> Optional[List[bytes]]:
+    """
+    Convert a PDF through a running service.
+
+    Returns:
+        List of image buffers, or None if no service is reachable
+    """
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="file"; filename="{Path(pdf_path).name}"\r\n'
+        "Content-Type: application/pdf\r\n\r\n"
+    ).encode() + Path(pdf_path).read_bytes() + f"\r\n--{boundary}--\r\n".encode()
+
+    request = urllib.request.Request(
+        f"{SERVICE_URL}/convert?{urlencode({'dpi': dpi, 'format': output_format})}",
+        data=body,
+        headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=300) as response:
+            response_boundary = response.headers.get_param("boundary")
+            payload = response.read()
+    except urllib.error.HTTPError as e:
+        raise Exception(f"PDF service error ({e.code}): {e.read().decode(errors='replace')}")
+    except (urllib.error.URLError, ConnectionError):
+        return None
+
+    return _parse_multipart(payload, response_boundary)
+
+
+def serve(port: int):
+    import uvicorn
+
+    uvicorn.run(create_app(), host="0.0.0.0", port=port)
+
+
 def main():
     parser = argparse.ArgumentParser(description="Convert PDF to images")
-    parser.add_argument("pdf_path", help="Path to PDF file")
+    parser.add_argument("pdf_path", nargs="?", help="Path to PDF file")
     parser.add_argument("--dpi", type=int, default=300, help="Resolution (default: 300)")
     parser.add_argument("--format", default="png", choices=["png", "jpeg", "jpg"], help="Output format")
     parser.add_argument("--output-dir", help="Directory to save images (optional)")
     parser.add_argument("--json", action="store_true", help="Output as JSON with base64 encoded images")
+    parser.add_argument("--local", action="store_true", help="Convert in-process instead of via a running service")
+    parser.add_argument("--serve", action="store_true", help="Run the HTTP conversion service")
+    parser.add_argument("--port", type=int, default=SERVICE_PORT, help=f"Service port (default: {SERVICE_PORT})")
 
     args = parser.parse_args()
 
+    if args.serve:
+        serve(args.port)
+        return
+
+    if not args.pdf_path:
+        parser.error("pdf_path is required unless --serve is given")
+
     # Validate PDF exists
     pdf_path = Path(args.pdf_path)
     if not pdf_path.exists():
@@ -101,8 +482,12 @@ def main():
         sys.exit(1)
 
     try:
-        # Convert PDF to images
-        images = pdf_to_images(str(pdf_path), dpi=args.dpi, output_format=args.format)
+        # Convert PDF to images, preferring an already-warm service
+        images = None
+        if not args.local:
+            images = convert_via_service(str(pdf_path), dpi=args.dpi, output_format=args.format)
+        if images is None:
+            images = pdf_to_images(str(pdf_path), dpi=args.dpi, output_format=args.format)
 
         if args.json:
             # Output as JSON